@@ -1,24 +1,33 @@
 import os
+import io
+import sys
 import logging
-import pandas as pd
 import numpy as np
+# Keep Numba's compiled-function cache inside the project directory. Render discards files
+# written at runtime on every deploy, so the cache is only reused across deploys when it is
+# filled during the build: set the Build Command to
+#     pip install -r requirement.txt && python bot.py --warm-up
+if 'RENDER' in os.environ:
+    os.environ.setdefault('NUMBA_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.numba_cache'))
+import numba
 import matplotlib
 # Use non-interactive backend for Render
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
-import schedule
 import time
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputFile
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
-from telegram.constants import ParseMode
+from telegram.constants import ParseMode, ChatMemberStatus
 from telegram.error import TelegramError, BadRequest
 from dotenv import load_dotenv
 import json
 import sqlite3
 import hashlib
 import aiohttp
+from cachetools import TTLCache
 from typing import Dict, List, Optional, Tuple
 import warnings
 
@@ -40,11 +49,119 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Per-user runtime state, one row per user (see BinaryTradingBot.setup_user_state).
+# Timestamps are time.monotonic() values: in-memory only, never persisted.
+USER_STATE_DTYPE = np.dtype([
+    ('last_signal_ts', 'f8'),
+    ('cooldown_until', 'f8'),
+    ('is_premium', 'u1'),
+    ('notifications', 'u1'),
+    ('pairs_mask', 'i8'),
+])
+
+def content_digest(*parts) -> str:
+    """Short stable digest for cache keys and signatures (BLAKE2b: fastest portable hashlib hash)
+
+    bytes parts are hashed as-is; anything else is hashed via str().
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode())
+        digest.update(b'|')
+    return digest.hexdigest()
+
+@numba.njit(cache=True, fastmath=True)
+def compute_indicators(prices: np.ndarray, rsi_period: int = 14) -> Tuple[float, float, float]:
+    """Return (sma_10, sma_20, rsi) for a price series in a single pass"""
+    n = prices.shape[0]
+    sum_10 = 0.0
+    sum_20 = 0.0
+    avg_gain = 0.0
+    avg_loss = 0.0
+    for i in range(n):
+        p = prices[i]
+        if i >= n - 10:
+            sum_10 += p
+        if i >= n - 20:
+            sum_20 += p
+        if i > 0:
+            change = p - prices[i - 1]
+            gain = change if change > 0.0 else 0.0
+            loss = -change if change < 0.0 else 0.0
+            if i <= rsi_period:
+                # Seed with a plain average, then switch to Wilder smoothing
+                avg_gain += (gain - avg_gain) / i
+                avg_loss += (loss - avg_loss) / i
+            else:
+                avg_gain = (avg_gain * (rsi_period - 1) + gain) / rsi_period
+                avg_loss = (avg_loss * (rsi_period - 1) + loss) / rsi_period
+    sma_10 = sum_10 / min(n, 10) if n > 0 else np.nan
+    sma_20 = sum_20 / min(n, 20) if n > 0 else np.nan
+    if avg_loss == 0.0:
+        rsi = 50.0 if avg_gain == 0.0 else 100.0
+    else:
+        rsi = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+    return sma_10, sma_20, rsi
+
+@numba.njit(parallel=True, cache=True)
+def analyze_all(prices: np.ndarray, n_valid: np.ndarray, rsi_period: int = 14) -> np.ndarray:
+    """Indicators for every row of an (n_pairs, n_bars) price matrix, one pair per thread
+
+    Rows are right-aligned: row i holds its n_valid[i] most recent bars in its last columns.
+    """
+    n_bars = prices.shape[1]
+    out = np.empty((prices.shape[0], 3))
+    for i in numba.prange(prices.shape[0]):
+        sma_10, sma_20, rsi = compute_indicators(prices[i, n_bars - n_valid[i]:], rsi_period)
+        out[i, 0] = sma_10
+        out[i, 1] = sma_20
+        out[i, 2] = rsi
+    return out
+
+def warm_up_indicators():
+    """Compile (or load from cache) the indicator kernels so the first signal doesn't pay for it"""
+    prices = np.linspace(1.0, 2.0, 32)
+    compute_indicators(prices, 14)
+    analyze_all(np.vstack((prices, prices)), np.array([32, 16], dtype=np.int64), 14)
+
 class BinaryTradingBot:
+    # Hot-path statements, kept as constants so sqlite3's statement cache reuses them
+    INSERT_SIGNAL_SQL = '''
+        INSERT INTO signals (pair, direction, expiry_time, confidence, price,
+                             stop_loss, take_profit, signal_type, strategy)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+    INSERT_USER_SIGNAL_SQL = 'INSERT INTO user_signals (user_id, signal_id) VALUES (?, ?)'
+    SELECT_PAIR_SUBSCRIBERS_SQL = '''
+        SELECT user_id FROM users
+        WHERE notification_enabled = 1 AND (preferred_pairs_mask & ?) != 0
+    '''
+    UPDATE_PREFERRED_PAIRS_SQL = '''
+        UPDATE users SET preferred_pairs_mask = ?, preferred_pairs = ? WHERE user_id = ?
+    '''
+    SELECT_USER_HISTORY_SQL = '''
+        SELECT s.pair, s.direction, s.confidence, s.price, s.created_at
+        FROM user_signals us JOIN signals s ON s.id = us.signal_id
+        WHERE us.user_id = ?
+        ORDER BY us.received_at DESC
+        LIMIT ?
+    '''
+
+    # Price history kept per pair in a fixed-size ring buffer
+    MAX_BARS = 512
+
+    # Bump whenever the schema script changes so existing databases pick it up
+    SCHEMA_VERSION = 3
+
     def __init__(self):
         self.config = config.config
-        self.application = Application.builder().token(self.config.BOT_TOKEN).build()
-        self.user_cooldown = {}
+        self.application = (
+            Application.builder()
+            .token(self.config.BOT_TOKEN)
+            .post_init(self.post_init)
+            .post_shutdown(self.post_shutdown)
+            .build()
+        )
         self.setup_handlers()
         self.setup_database()
         self.setup_advanced_features()
@@ -59,82 +176,405 @@ class BinaryTradingBot:
     def setup_advanced_features(self):
         """Setup advanced features"""
         self.session = None
-        self.last_signal_time = {}
         self.user_analytics = {}
-        self.premium_users = set()
+        # Channel membership needs a Telegram API round trip; remember it briefly
+        self._sub_cache = TTLCache(maxsize=10000, ttl=60)
+        # Repeat broadcasts of the same bar reuse the analysis and Telegram's stored upload
+        self._analysis_cache = TTLCache(maxsize=256, ttl=60)
+        self._chart_file_ids = TTLCache(maxsize=256, ttl=300)
+        # Rendered PNGs, so a retry after a failed first upload doesn't render again
+        self._chart_pngs = TTLCache(maxsize=32, ttl=300)
+        # One lock per chart being uploaded; concurrent senders wait for its file_id
+        self._chart_locks = {}
+        self.setup_user_state()
+        self.setup_price_buffers()
+        self.setup_chart()
+        warm_up_indicators()
+    
+    async def post_init(self, application: Application):
+        """Open the shared HTTP session and start the DB writer once the event loop is running"""
+        self._write_q = asyncio.Queue()
+        self._writer_task = asyncio.create_task(self._db_writer())
+        
+        # One pooled session for all outbound requests: keep-alive + cached DNS
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=100, ttl_dns_cache=300, enable_cleanup_closed=True),
+            timeout=aiohttp.ClientTimeout(total=10)
+        )
+    
+    async def post_shutdown(self, application: Application):
+        """Flush pending writes and release network resources on shutdown"""
+        # Sentinel rather than cancel(): the writer finishes its in-flight batch first
+        await self._write_q.put(None)
+        await self._writer_task
+        pending = []
+        while not self._write_q.empty():
+            pending.append(self._write_q.get_nowait())
+        if pending:
+            await self.run_db(self._insert_user_signals, pending)
+        
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+    
+    def setup_user_state(self):
+        """Load cooldown/premium/notification flags into a structured array for vectorized scans"""
+        rows = self.conn.execute(
+            'SELECT user_id, is_premium, notification_enabled, preferred_pairs_mask FROM users'
+        ).fetchall()
+        capacity = max(len(rows), 64)
+        self._user_ids = np.zeros(capacity, dtype=np.int64)
+        self._user_state = np.zeros(capacity, dtype=USER_STATE_DTYPE)
+        self._user_idx = {}
+        self._user_count = 0
+        for user_id, is_premium, notifications, pairs_mask in rows:
+            i = self._user_slot(user_id)
+            self._user_state['is_premium'][i] = bool(is_premium)
+            self._user_state['notifications'][i] = bool(notifications)
+            self._user_state['pairs_mask'][i] = pairs_mask
+    
+    def _user_slot(self, user_id: int) -> int:
+        """Return the state row for a user, appending (and growing the arrays) if new"""
+        i = self._user_idx.get(user_id)
+        if i is not None:
+            return i
+        if self._user_count == len(self._user_ids):
+            capacity = len(self._user_ids) * 2
+            self._user_ids = np.resize(self._user_ids, capacity)
+            self._user_state = np.resize(self._user_state, capacity)
+        i = self._user_count
+        self._user_ids[i] = user_id
+        self._user_state[i] = (0.0, 0.0, 0, 1, self.config.DEFAULT_PAIRS_MASK)
+        self._user_idx[user_id] = i
+        self._user_count += 1
+        return i
+    
+    def start_cooldown(self, user_id: int):
+        """Mark a signal as sent to the user and start their cooldown"""
+        now = time.monotonic()
+        i = self._user_slot(user_id)
+        self._user_state['last_signal_ts'][i] = now
+        self._user_state['cooldown_until'][i] = now + self.config.USER_COOLDOWN
+    
+    def is_on_cooldown(self, user_id: int) -> bool:
+        """Check whether the user must wait before requesting another signal"""
+        i = self._user_idx.get(user_id)
+        return i is not None and self._user_state['cooldown_until'][i] > time.monotonic()
+    
+    def is_premium_user(self, user_id: int) -> bool:
+        """Check the cached premium flag for a user"""
+        i = self._user_idx.get(user_id)
+        return i is not None and bool(self._user_state['is_premium'][i])
+    
+    def set_user_flags(self, user_id: int, is_premium: Optional[bool] = None,
+                       notifications: Optional[bool] = None):
+        """Update the in-memory premium/notification flags after a DB change"""
+        i = self._user_slot(user_id)
+        if is_premium is not None:
+            self._user_state['is_premium'][i] = is_premium
+        if notifications is not None:
+            self._user_state['notifications'][i] = notifications
+    
+    async def is_subscribed(self, user_id: int) -> bool:
+        """Check channel membership, served from a short-lived cache when possible"""
+        if not self.config.CHANNEL_REQUIRED:
+            return True
+        if user_id in self._sub_cache:
+            return True
+        try:
+            member = await self.application.bot.get_chat_member(self.config.CHANNEL_USERNAME, user_id)
+        except TelegramError as e:
+            logger.error(f"Subscription check failed for {user_id}: {e}")
+            return False
+        if member.status == ChatMemberStatus.RESTRICTED:
+            # Restricted users may still be in the channel
+            subscribed = member.is_member
+        else:
+            subscribed = member.status in (ChatMemberStatus.MEMBER, ChatMemberStatus.ADMINISTRATOR,
+                                           ChatMemberStatus.OWNER)
+        # Only positive results are cached, so a user who just joined is let in right away
+        if subscribed:
+            self._sub_cache[user_id] = True
+        return subscribed
+    
+    def ready_users(self, premium_only: bool = False, pair: Optional[str] = None) -> np.ndarray:
+        """User ids with notifications on and no active cooldown, in one vectorized pass"""
+        state = self._user_state[:self._user_count]
+        mask = (state['cooldown_until'] <= time.monotonic()) & (state['notifications'] == 1)
+        if premium_only:
+            mask &= state['is_premium'] == 1
+        if pair is not None:
+            mask &= (state['pairs_mask'] & self.config.PAIR_BITS[pair]) != 0
+        return self._user_ids[:self._user_count][mask]
+    
+    def setup_price_buffers(self):
+        """Preallocate a float64 ring buffer per pair so ticks never reallocate"""
+        pairs = self.config.SUPPORTED_PAIRS + self.config.OTC_PAIRS
+        self._bars = {pair: np.empty(self.MAX_BARS, dtype=np.float64) for pair in pairs}
+        self._cursor = {pair: 0 for pair in pairs}
+    
+    def push_price(self, pair: str, price: float):
+        """Append a tick to the pair's ring buffer, overwriting the oldest bar when full"""
+        cursor = self._cursor[pair]
+        self._bars[pair][cursor % self.MAX_BARS] = price
+        self._cursor[pair] = cursor + 1
+    
+    def recent_prices(self, pair: str, n: Optional[int] = None) -> np.ndarray:
+        """Copy of up to the last n prices for a pair, oldest first, as a contiguous float64 array"""
+        buf = self._bars[pair]
+        cursor = self._cursor[pair]
+        count = min(cursor, self.MAX_BARS)
+        if n is not None:
+            count = min(count, max(n, 0))
+        # Always a copy: a view would be overwritten by later push_price calls while held.
+        # Only the requested tail is copied, from at most two ring segments.
+        out = np.empty(count, dtype=np.float64)
+        end = cursor % self.MAX_BARS
+        start = end - count
+        if start >= 0:
+            out[:] = buf[start:end]
+        else:
+            out[:-start] = buf[start:]
+            out[-start:] = buf[:end]
+        return out
+    
+    def setup_chart(self):
+        """Build the chart figure once; create_binary_chart only updates its artists"""
+        # Rendering takes ~100 ms of CPU; do it on one dedicated thread so the event loop stays
+        # free and the shared (not thread-safe) figure is only ever touched by that thread
+        self._chart_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='chart')
+        self._chart_fig, self._chart_ax = plt.subplots(figsize=(10, 6))
+        self._price_line, = self._chart_ax.plot([], [], label='Price', color='blue', linewidth=2)
+        self._sma10_line = self._chart_ax.axhline(y=0, color='orange', linestyle='--', label='SMA 10')
+        self._sma20_line = self._chart_ax.axhline(y=0, color='red', linestyle='--', label='SMA 20')
+        self._current_line = self._chart_ax.axhline(y=0, color='green', linestyle='-',
+                                                    linewidth=2, label='Current')
+        self._chart_ax.grid(True, alpha=0.3)
+        # Offset notation would put "+1.085e0"-style text above the axes, outside the fixed layout
+        self._chart_ax.ticklabel_format(axis='y', useOffset=False)
+        
+        # Layout once here instead of bbox_inches='tight' (an extra render) on every save.
+        # Size it against a representative title and tick labels, not an empty axes.
+        self._chart_ax.set_title('BINARY: EUR/USD Crypto - HIGH (CALL) | 5min | Conf: 95.0%')
+        self._chart_ax.set_xlim(0, 100)
+        self._chart_ax.set_ylim(10000.00005, 10000.00095)
+        self._chart_fig.tight_layout()
+        # set_xlim/set_ylim switched autoscaling off; create_binary_chart relies on it
+        self._chart_ax.set_autoscale_on(True)
     
     def setup_database(self):
         """Initialize SQLite database with advanced schema"""
-        self.conn = sqlite3.connect(self.config.DATABASE_NAME, check_same_thread=False)
+        self.conn = sqlite3.connect(self.config.DATABASE_NAME, check_same_thread=False,
+                                    cached_statements=256)
+        # Handlers are async; run queries on one dedicated thread so they neither
+        # block the event loop nor interleave transactions on the shared connection
+        self._db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite')
         cursor = self.conn.cursor()
         
-        # Users table with enhanced fields
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                first_name TEXT,
-                last_name TEXT,
-                risk_level TEXT DEFAULT 'medium',
-                preferred_pairs TEXT DEFAULT 'EUR/USD,GBP/USD',
-                notification_enabled INTEGER DEFAULT 1,
-                is_premium INTEGER DEFAULT 0,
-                premium_until TIMESTAMP NULL,
-                joined_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                total_signals INTEGER DEFAULT 0,
-                successful_signals INTEGER DEFAULT 0,
-                last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                language_code TEXT DEFAULT 'en'
-            )
+        # WAL + relaxed sync: commits no longer fsync the rollback journal every time
+        cursor.executescript('''
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            PRAGMA temp_store=MEMORY;
+            PRAGMA cache_size=-20000;
+            PRAGMA mmap_size=268435456;
         ''')
         
-        # Enhanced signals table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS signals (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                pair TEXT,
-                direction TEXT,
-                expiry_time TIMESTAMP,
-                confidence REAL,
-                price REAL,
-                stop_loss REAL,
-                take_profit REAL,
-                signal_type TEXT DEFAULT 'regular',
-                strategy TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                success INTEGER DEFAULT NULL,
-                actual_result TEXT DEFAULT NULL,
-                profit_loss REAL DEFAULT NULL
-            )
-        ''')
-        
-        # User signals tracking
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_signals (
-                user_id INTEGER,
-                signal_id INTEGER,
-                received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                action_taken TEXT DEFAULT 'viewed',
-                result_noted INTEGER DEFAULT 0,
-                FOREIGN KEY (user_id) REFERENCES users (user_id),
-                FOREIGN KEY (signal_id) REFERENCES signals (id)
-            )
-        ''')
-        
-        # Channel subscription tracking
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS channel_subs (
-                user_id INTEGER PRIMARY KEY,
-                channel_username TEXT,
-                subscribed INTEGER DEFAULT 0,
-                last_checked TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (user_id)
-            )
-        ''')
+        # Warm start: schema is already current, skip the DDL entirely
+        if cursor.execute('PRAGMA user_version').fetchone()[0] < self.SCHEMA_VERSION:
+            # DEFAULT clauses can't take bound parameters, so quote the literal by hand
+            default_pairs = ','.join(self.config.DEFAULT_PAIRS).replace("'", "''")
+            default_mask = self.config.DEFAULT_PAIRS_MASK
+            
+            # One transaction for the migration, the DDL and the user_version bump, so they
+            # commit together: a single schema lock and fsync, and no half-applied upgrade
+            cursor.execute('BEGIN')
+            try:
+                # Databases created before preferred_pairs_mask existed need the column added and backfilled
+                columns = {row[1] for row in cursor.execute('PRAGMA table_info(users)')}
+                if columns and 'preferred_pairs_mask' not in columns:
+                    cursor.execute(
+                        f'ALTER TABLE users ADD COLUMN preferred_pairs_mask INTEGER DEFAULT {default_mask}'
+                    )
+                    cursor.execute('UPDATE users SET preferred_pairs_mask = 0')
+                    cursor.executemany(
+                        "UPDATE users SET preferred_pairs_mask = preferred_pairs_mask | ? "
+                        "WHERE ',' || preferred_pairs || ',' LIKE ?",
+                        [(bit, f'%,{pair},%') for pair, bit in self.config.PAIR_BITS.items()]
+                    )
+                
+                self._execute_statements(cursor, f'''
+                    -- Users table with enhanced fields
+                    CREATE TABLE IF NOT EXISTS users (
+                        user_id INTEGER PRIMARY KEY,
+                        username TEXT,
+                        first_name TEXT,
+                        last_name TEXT,
+                        risk_level TEXT DEFAULT 'medium',
+                        preferred_pairs TEXT DEFAULT '{default_pairs}',
+                        preferred_pairs_mask INTEGER DEFAULT {default_mask},
+                        notification_enabled INTEGER DEFAULT 1,
+                        is_premium INTEGER DEFAULT 0,
+                        premium_until TIMESTAMP NULL,
+                        joined_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        total_signals INTEGER DEFAULT 0,
+                        successful_signals INTEGER DEFAULT 0,
+                        last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        language_code TEXT DEFAULT 'en'
+                    );
+                    
+                    -- Enhanced signals table
+                    CREATE TABLE IF NOT EXISTS signals (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        pair TEXT,
+                        direction TEXT,
+                        expiry_time TIMESTAMP,
+                        confidence REAL,
+                        price REAL,
+                        stop_loss REAL,
+                        take_profit REAL,
+                        signal_type TEXT DEFAULT 'regular',
+                        strategy TEXT,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        success INTEGER DEFAULT NULL,
+                        actual_result TEXT DEFAULT NULL,
+                        profit_loss REAL DEFAULT NULL
+                    );
+                    
+                    -- User signals tracking
+                    CREATE TABLE IF NOT EXISTS user_signals (
+                        user_id INTEGER,
+                        signal_id INTEGER,
+                        received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        action_taken TEXT DEFAULT 'viewed',
+                        result_noted INTEGER DEFAULT 0,
+                        FOREIGN KEY (user_id) REFERENCES users (user_id),
+                        FOREIGN KEY (signal_id) REFERENCES signals (id)
+                    );
+                    
+                    -- Channel subscription tracking
+                    CREATE TABLE IF NOT EXISTS channel_subs (
+                        user_id INTEGER PRIMARY KEY,
+                        channel_username TEXT,
+                        subscribed INTEGER DEFAULT 0,
+                        last_checked TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        FOREIGN KEY (user_id) REFERENCES users (user_id)
+                    );
+                    
+                    -- Per-user signal history lookups
+                    CREATE INDEX IF NOT EXISTS idx_user_signals_uid ON user_signals (user_id);
+                    
+                    -- History/stats scans and broadcast recipient selection
+                    CREATE INDEX IF NOT EXISTS idx_signals_created ON signals (created_at DESC);
+                    CREATE INDEX IF NOT EXISTS idx_signals_pair_created ON signals (pair, created_at DESC);
+                    CREATE INDEX IF NOT EXISTS idx_users_notify ON users (notification_enabled, is_premium)
+                        WHERE notification_enabled = 1;
+                    
+                    PRAGMA user_version = {self.SCHEMA_VERSION};
+                ''')
+            except Exception:
+                self.conn.rollback()
+                raise
+            self.conn.commit()
         
-        self.conn.commit()
         logger.info("Database initialized successfully")
     
+    @staticmethod
+    def _execute_statements(cursor: sqlite3.Cursor, script: str):
+        """Run a multi-statement script inside the current transaction (executescript would commit it)"""
+        statement = ''
+        for line in script.splitlines(keepends=True):
+            statement += line
+            if sqlite3.complete_statement(statement):
+                cursor.execute(statement)
+                statement = ''
+    
+    async def run_db(self, func, *args):
+        """Run a blocking database call off the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._db_executor, func, *args)
+    
+    def _save_signal(self, signal: Dict) -> int:
+        cursor = self.conn.execute(self.INSERT_SIGNAL_SQL, (
+            signal['pair'],
+            signal['direction'],
+            signal.get('expiry_time'),
+            signal['confidence'],
+            signal['current_price'],
+            signal.get('stop_loss'),
+            signal.get('take_profit'),
+            signal.get('signal_type', 'regular'),
+            signal.get('strategy'),
+        ))
+        self.conn.commit()
+        return cursor.lastrowid
+    
+    def _insert_user_signals(self, rows: List[Tuple[int, int]]) -> None:
+        with self.conn:
+            self.conn.executemany(self.INSERT_USER_SIGNAL_SQL, rows)
+    
+    def _get_user_history(self, user_id: int, limit: int) -> List[Tuple]:
+        return self.conn.execute(self.SELECT_USER_HISTORY_SQL, (user_id, limit)).fetchall()
+    
+    async def save_signal(self, signal: Dict) -> int:
+        """Persist a generated signal and return its id"""
+        return await self.run_db(self._save_signal, signal)
+    
+    async def _db_writer(self):
+        """Drain queued user_signals rows and commit them in groups until a None sentinel arrives"""
+        stopping = False
+        while not stopping:
+            item = await self._write_q.get()
+            batch = []
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= 500 or self._write_q.empty():
+                    break
+                item = self._write_q.get_nowait()
+            stopping = item is None
+            if batch:
+                try:
+                    await self.run_db(self._insert_user_signals, batch)
+                except Exception as e:
+                    # Keep the writer alive; a dead task would leave the queue growing forever
+                    logger.error(f"Failed to write {len(batch)} user signals: {e}")
+    
+    async def record_user_signal(self, user_id: int, signal_id: int):
+        """Queue a user/signal delivery record; the writer task commits it"""
+        await self._write_q.put((user_id, signal_id))
+    
+    async def record_broadcast(self, signal_id: int, user_ids) -> None:
+        """Track a signal delivered to many users in one transaction"""
+        rows = [(int(user_id), signal_id) for user_id in user_ids]
+        await self.run_db(self._insert_user_signals, rows)
+    
+    def _get_pair_subscribers(self, pair_bit: int) -> List[int]:
+        return [row[0] for row in self.conn.execute(self.SELECT_PAIR_SUBSCRIBERS_SQL, (pair_bit,))]
+    
+    def _set_preferred_pairs(self, user_id: int, pairs_mask: int, pairs_text: str):
+        with self.conn:
+            self.conn.execute(self.UPDATE_PREFERRED_PAIRS_SQL, (pairs_mask, pairs_text, user_id))
+    
+    async def get_pair_subscribers(self, pair: str) -> List[int]:
+        """Users with notifications on who follow the given pair"""
+        return await self.run_db(self._get_pair_subscribers, self.config.PAIR_BITS[pair])
+    
+    async def toggle_preferred_pair(self, user_id: int, pair: str, enabled: bool) -> int:
+        """Add or remove a pair from the user's preferences and return the new mask"""
+        i = self._user_slot(user_id)
+        bit = self.config.PAIR_BITS[pair]
+        pairs_mask = int(self._user_state['pairs_mask'][i])
+        pairs_mask = pairs_mask | bit if enabled else pairs_mask & ~bit
+        self._user_state['pairs_mask'][i] = pairs_mask
+        # The text column is kept for display; filtering only uses the mask
+        pairs_text = ','.join(p for p, b in self.config.PAIR_BITS.items() if pairs_mask & b)
+        await self.run_db(self._set_preferred_pairs, user_id, pairs_mask, pairs_text)
+        return pairs_mask
+    
+    async def get_user_history(self, user_id: int, limit: int = 10) -> List[Tuple]:
+        """Fetch the most recent signals delivered to a user"""
+        return await self.run_db(self._get_user_history, user_id, limit)
+    
     def setup_handlers(self):
         """Setup all command and callback handlers"""
         # Command handlers
@@ -157,44 +597,122 @@ class BinaryTradingBot:
         
         logger.info("Handlers setup completed")
     
+    def analyze_prices(self, prices) -> Dict:
+        """Compute the technical indicators used by signals and charts"""
+        prices = np.ascontiguousarray(prices, dtype=np.float64)
+        sma_10, sma_20, rsi = compute_indicators(prices, self.config.RSI_PERIOD)
+        return {'sma_10': sma_10, 'sma_20': sma_20, 'rsi': rsi}
+    
+    def analyze_pair(self, pair: str) -> Dict:
+        """Indicators for a pair's buffered prices, memoized until a new bar arrives"""
+        key = (pair, self._cursor[pair])
+        analysis = self._analysis_cache.get(key)
+        if analysis is None:
+            analysis = self.analyze_prices(self.recent_prices(pair))
+            self._analysis_cache[key] = analysis
+        # Callers may add keys to the analysis; don't let that leak into the cache
+        return dict(analysis)
+    
+    def analyze_pairs(self, prices_by_pair: Dict[str, np.ndarray]) -> Dict[str, Dict]:
+        """Compute indicators for many pairs at once, in parallel across pairs"""
+        pairs = list(prices_by_pair)
+        if not pairs:
+            return {}
+        # Right-align series of different lengths; each row is analyzed over its own bars only
+        n_valid = np.array([len(prices_by_pair[pair]) for pair in pairs], dtype=np.int64)
+        n_bars = int(n_valid.max())
+        matrix = np.full((len(pairs), n_bars), np.nan)
+        for i, pair in enumerate(pairs):
+            matrix[i, n_bars - n_valid[i]:] = prices_by_pair[pair]
+        results = analyze_all(matrix, n_valid, self.config.RSI_PERIOD)
+        return {
+            pair: {'sma_10': row[0], 'sma_20': row[1], 'rsi': row[2]}
+            for pair, row in zip(pairs, results)
+        }
+    
     # ... (rest of your methods remain the same, they don't need modification for Render)
     
-    async def create_binary_chart(self, signal: Dict) -> str:
-        """Create binary options chart"""
+    def chart_key(self, signal: Dict) -> str:
+        """Digest of everything drawn on a signal's chart"""
+        prices = signal['prices']
+        analysis = signal['analysis']
+        return content_digest(
+            signal['pair'], signal['direction'], signal['expiry_minutes'], signal['confidence'],
+            signal['current_price'], analysis['sma_10'], analysis['sma_20'],
+            np.ascontiguousarray(prices, dtype=np.float64).tobytes()
+        )
+    
+    async def send_chart(self, chat_id: int, signal: Dict, **kwargs):
+        """Send a signal's chart, re-sending Telegram's file_id instead of re-rendering on repeats"""
+        key = self.chart_key(signal)
+        file_id = self._chart_file_ids.get(key)
+        if file_id is None:
+            # During a fan-out the first caller renders and uploads; the rest wait for its file_id
+            lock = self._chart_locks.setdefault(key, asyncio.Lock())
+            try:
+                async with lock:
+                    file_id = self._chart_file_ids.get(key)
+                    if file_id is None:
+                        return await self._upload_chart(key, chat_id, signal, **kwargs)
+            finally:
+                if not lock.locked():
+                    self._chart_locks.pop(key, None)
+        return await self.application.bot.send_photo(chat_id, photo=file_id, **kwargs)
+    
+    async def _upload_chart(self, key: str, chat_id: int, signal: Dict, **kwargs):
+        png = self._chart_pngs.get(key)
+        if png is None:
+            buf = await self.create_binary_chart(signal)
+            if buf is None:
+                return None
+            png = buf.getvalue()
+            self._chart_pngs[key] = png
+        message = await self.application.bot.send_photo(
+            chat_id, photo=InputFile(png, filename='chart.png'), **kwargs
+        )
+        self._chart_file_ids[key] = message.photo[-1].file_id
+        self._chart_pngs.pop(key, None)
+        return message
+    
+    def _render_chart(self, signal: Dict) -> io.BytesIO:
+        prices = signal['prices']
+        analysis = signal['analysis']
+        
+        # Create x-axis labels
+        x = list(range(len(prices)))
+        
+        market_type = signal.get('market_type', 'forex')
+        market_label = "OTC" if market_type == 'otc' else "Forex"
+        
+        direction_text = "HIGH (CALL)" if signal['direction'] == 'HIGH' else "LOW (PUT)"
+        
+        ax = self._chart_ax
+        self._price_line.set_data(x, prices)
+        self._sma10_line.set_ydata([analysis['sma_10']] * 2)
+        self._sma10_line.set_label(f'SMA 10: {analysis["sma_10"]:.4f}')
+        self._sma20_line.set_ydata([analysis['sma_20']] * 2)
+        self._sma20_line.set_label(f'SMA 20: {analysis["sma_20"]:.4f}')
+        self._current_line.set_ydata([signal['current_price']] * 2)
+        self._current_line.set_label(f'Current: {signal["current_price"]:.4f}')
+        
+        ax.set_title(f'BINARY: {signal["pair"]} - {direction_text} | {signal["expiry_minutes"]}min | Conf: {signal["confidence"]*100:.1f}%')
+        ax.legend()
+        ax.relim()
+        ax.autoscale_view()
+        
+        buf = io.BytesIO()
+        self._chart_fig.savefig(buf, format='png', dpi=100)
+        buf.seek(0)
+        return buf
+    
+    async def create_binary_chart(self, signal: Dict) -> Optional[io.BytesIO]:
+        """Create binary options chart as an in-memory PNG (sent via send_chart)"""
         try:
-            plt.figure(figsize=(10, 6))
-            
-            prices = signal['prices']
-            analysis = signal['analysis']
-            
-            # Create x-axis labels
-            x = list(range(len(prices)))
-            
-            plt.plot(x, prices, label='Price', color='blue', linewidth=2)
-            plt.axhline(y=analysis['sma_10'], color='orange', linestyle='--', 
-                       label=f'SMA 10: {analysis["sma_10"]:.4f}')
-            plt.axhline(y=analysis['sma_20'], color='red', linestyle='--', 
-                       label=f'SMA 20: {analysis["sma_20"]:.4f}')
-            plt.axhline(y=signal['current_price'], color='green', linestyle='-', 
-                       linewidth=2, label=f'Current: {signal["current_price"]:.4f}')
-            
-            market_type = signal.get('market_type', 'forex')
-            market_label = "OTC" if market_type == 'otc' else "Forex"
-            
-            direction_text = "HIGH (CALL)" if signal['direction'] == 'HIGH' else "LOW (PUT)"
-            
-            plt.title(f'BINARY: {signal["pair"]} - {direction_text} | {signal["expiry_minutes"]}min | Conf: {signal["confidence"]*100:.1f}%')
-            plt.legend()
-            plt.grid(True, alpha=0.3)
-            
-            filename = f"/tmp/binary_chart_{int(time.time())}.png"
-            plt.savefig(filename, dpi=150, bbox_inches='tight')
-            plt.close()
-            
-            return filename
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._chart_executor, self._render_chart, signal)
         except Exception as e:
             logger.error(f"Chart creation error: {e}")
-            return "/tmp/chart_error.png"
+            return None
     
     def run(self):
         """Start the bot"""
@@ -206,6 +724,14 @@ class BinaryTradingBot:
         print(f"💎 Premium Enabled: {self.config.PREMIUM_ENABLED}")
         print("=" * 50)
         
+        # libuv-based loop is noticeably cheaper per poll cycle; fall back silently if unavailable
+        if sys.platform != 'win32':
+            try:
+                import uvloop
+                uvloop.install()
+            except ImportError:
+                logger.info("uvloop not installed, using default asyncio event loop")
+        
         # Use webhook for production (Render) or polling for development
         if 'RENDER' in os.environ:
             # For Render, we'll use polling since it's simpler for bots
@@ -215,6 +741,11 @@ class BinaryTradingBot:
 
 # Main execution
 if __name__ == "__main__":
+    if '--warm-up' in sys.argv:
+        # Build step: compile the indicator kernels into NUMBA_CACHE_DIR and exit
+        warm_up_indicators()
+        print("✅ Indicator kernels compiled")
+        sys.exit(0)
     try:
         bot = BinaryTradingBot()
         bot.run()
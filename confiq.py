@@ -40,6 +40,14 @@ class Config:
             'GER30 Index', 'JPN225 Index', 'AUS200 Index'
         ]
         
+        # One bit per tradable pair so preferences are stored/filtered as an integer mask
+        self.PAIR_BITS = {pair: 1 << i for i, pair in enumerate(self.SUPPORTED_PAIRS + self.OTC_PAIRS)}
+        # Checked here, not in validate_config: masks reach SQLite before validation runs
+        if len(self.PAIR_BITS) > 63:
+            raise ValueError("At most 63 pairs fit in the preferred_pairs_mask column")
+        self.DEFAULT_PAIRS = ['EUR/USD', 'GBP/USD']
+        self.DEFAULT_PAIRS_MASK = sum(self.PAIR_BITS[pair] for pair in self.DEFAULT_PAIRS)
+        
         # Signal Configuration
         self.MIN_EXPIRY = 1  # minutes
         self.MAX_EXPIRY = 5  # minutes